@@ -4,10 +4,84 @@ Mirrors the pattern from src/server/image-generator.ts
 """
 
 import asyncio
-import json
+import copy
 import httpx
+import orjson
+import uuid
 import websockets
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+
+
+# Default generation size in pixels. UNet/VAE cost scales with pixel count,
+# so generate as small as SD 1.5 stays coherent (use 96 if quality suffers).
+DEFAULT_IMAGE_SIZE = 64
+
+# Static shape of the generation workflow (mirrors image-generator.ts, plus
+# an LCM-LoRA so the sampler converges in a handful of steps).
+# Built once; callers deep-copy it and fill in seed, size and prompt text.
+_WORKFLOW_TEMPLATE = {
+    "3": {
+        "inputs": {
+            "seed": 0,
+            "steps": 4,  # LCM needs only 2-8 steps
+            "cfg": 1.5,  # LCM wants low guidance
+            "sampler_name": "lcm",
+            "scheduler": "sgm_uniform",
+            "denoise": 1,
+            "model": ["10", 0],
+            "positive": ["6", 0],
+            "negative": ["7", 0],
+            "latent_image": ["5", 0],
+        },
+        "class_type": "KSampler",
+    },
+    "4": {
+        "inputs": {"ckpt_name": "v1-5-pruned-emaonly.safetensors"},
+        "class_type": "CheckpointLoaderSimple",
+    },
+    "5": {
+        "inputs": {
+            "width": DEFAULT_IMAGE_SIZE,
+            "height": DEFAULT_IMAGE_SIZE,
+            "batch_size": 1,
+        },
+        "class_type": "EmptyLatentImage",
+    },
+    "6": {
+        "inputs": {"text": "", "clip": ["10", 1]},
+        "class_type": "CLIPTextEncode",
+    },
+    "7": {
+        "inputs": {"text": "", "clip": ["10", 1]},
+        "class_type": "CLIPTextEncode",
+    },
+    "8": {
+        "inputs": {"samples": ["3", 0], "vae": ["4", 2]},
+        "class_type": "VAEDecode",
+    },
+    "9": {
+        "inputs": {"filename_prefix": "poc_sprite", "images": ["8", 0]},
+        "class_type": "SaveImage",
+    },
+    "10": {
+        "inputs": {
+            "lora_name": "lcm-lora-sdv1-5.safetensors",
+            "strength_model": 1.0,
+            "strength_clip": 1.0,
+            "model": ["4", 0],
+            "clip": ["4", 1],
+        },
+        "class_type": "LoraLoader",
+    },
+}
+
+# Per-image nodes (sampler, latent, positive encode, decode, save); the rest
+# of the template can be shared between images in one workflow
+_BRANCH_NODES = ("3", "5", "6", "8", "9")
+
+# Websocket message types the client acts on. ComfyUI also sends "status",
+# "progress" etc. on every sampling step; those are skipped unparsed.
+_WS_MESSAGE_MARKERS = ('"executing"', '"executed"', '"execution_error"')
 
 
 class ComfyUIClient:
@@ -17,19 +91,59 @@ class ComfyUIClient:
         self.base_url = base_url
         self.timeout = 120.0  # 2 minutes like image-generator.ts
 
+        # Shared HTTP client so every request reuses pooled keep-alive connections
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(self.timeout, connect=5.0),
+            limits=httpx.Limits(max_keepalive_connections=8, keepalive_expiry=60),
+        )
+
+        # One websocket for the client lifetime; completion notifications are
+        # dispatched to per-prompt futures by a background reader task
+        self.client_id = self._generate_client_id()
+        self._ws = None
+        self._ws_task: Optional[asyncio.Task] = None
+        self._ws_lock = asyncio.Lock()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._outputs: Dict[str, Dict[str, dict]] = {}
+
+    async def __aenter__(self) -> "ComfyUIClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """Close the websocket and the underlying HTTP connection pool"""
+        if self._ws_task is not None:
+            self._ws_task.cancel()
+            try:
+                await self._ws_task
+            except asyncio.CancelledError:
+                pass
+            self._ws_task = None
+
+        if self._ws is not None:
+            await self._ws.close()
+            self._ws = None
+
+        await self._http.aclose()
+
     async def is_available(self) -> bool:
         """Check if ComfyUI is running and responsive"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/system_stats", timeout=5.0
-                )
-                return response.status_code == 200
+            response = await self._http.get("/system_stats", timeout=5.0)
+            return response.status_code == 200
         except Exception:
             return False
 
     async def generate_image(
-        self, prompt: str, negative_prompt: str, seed: int, width: int = 128, height: int = 128
+        self,
+        prompt: str,
+        negative_prompt: str,
+        seed: int,
+        width: int = DEFAULT_IMAGE_SIZE,
+        height: int = DEFAULT_IMAGE_SIZE,
     ) -> Optional[bytes]:
         """
         Generate a single image using ComfyUI workflow
@@ -45,69 +159,170 @@ class ComfyUIClient:
             Image data as bytes, or None if generation fails
         """
         workflow = self._create_workflow(prompt, negative_prompt, seed, width, height)
-        client_id = self._generate_client_id()
 
         try:
-            # Queue the prompt
-            prompt_id = await self._queue_prompt(workflow, client_id)
+            images = await self._run_workflow(workflow, 1)
+            return images[0]
+        except Exception as e:
+            print(f"[ComfyUI] Generation failed: {e}")
+            return None
 
-            # Wait for completion via WebSocket
-            await self._wait_for_completion(prompt_id, client_id)
+    async def generate_images(
+        self,
+        prompts: List[str],
+        negative_prompt: str,
+        seeds: List[int],
+        width: int = DEFAULT_IMAGE_SIZE,
+        height: int = DEFAULT_IMAGE_SIZE,
+    ) -> Optional[List[bytes]]:
+        """
+        Generate one image per prompt in a single ComfyUI workflow
 
-            # Retrieve generated image
-            image_data = await self._get_generated_image(prompt_id)
+        All branches share one checkpoint/LoRA loader and one negative CLIP
+        encode, so the negative prompt is encoded once per submission
+        instead of once per image.
 
-            return image_data
+        Args:
+            prompts: Positive prompts, one per image
+            negative_prompt: Negative prompt shared by every image
+            seeds: Random seeds, one per prompt
+            width: Image width in pixels
+            height: Image height in pixels
 
+        Returns:
+            List of image data in the same order as prompts, or None if
+            generation fails
+        """
+        if len(prompts) != len(seeds):
+            raise ValueError("prompts and seeds must have the same length")
+
+        workflow, output_nodes = self._create_multi_workflow(
+            prompts, negative_prompt, seeds, width, height
+        )
+
+        try:
+            return await self._run_workflow(workflow, len(prompts), output_nodes)
         except Exception as e:
             print(f"[ComfyUI] Generation failed: {e}")
             return None
 
+    async def _run_workflow(
+        self,
+        workflow: dict,
+        expected_images: int,
+        output_nodes: Optional[List[str]] = None,
+    ) -> List[bytes]:
+        """Queue a workflow, wait for it to finish and fetch its images"""
+        # Subscribe and register the prompt before queueing so no completion
+        # message is missed; ComfyUI accepts a client-chosen prompt_id
+        await self._ensure_websocket()
+        prompt_id = str(uuid.uuid4())
+        self._pending[prompt_id] = asyncio.get_running_loop().create_future()
+        self._outputs[prompt_id] = {}
+
+        try:
+            # Queue the prompt
+            queued_id = await self._queue_prompt(workflow, prompt_id)
+
+            # Older ComfyUI builds ignore a client-chosen prompt_id and assign
+            # their own; re-register under the id the server will report
+            if queued_id != prompt_id:
+                await self._adopt_prompt_id(prompt_id, queued_id)
+                prompt_id = queued_id
+
+            # Wait for completion via WebSocket
+            outputs = await self._wait_for_completion(prompt_id)
+        finally:
+            # Forget the prompt so late messages for it are ignored
+            self._pending.pop(prompt_id, None)
+            self._outputs.pop(prompt_id, None)
+
+        # Retrieve generated images
+        images = await self._get_generated_images(prompt_id, outputs, output_nodes)
+
+        if len(images) < expected_images:
+            raise Exception(
+                f"Expected {expected_images} images, got {len(images)}"
+            )
+
+        return images
+
+    async def _adopt_prompt_id(self, requested_id: str, queued_id: str):
+        """Move a registered prompt to the id ComfyUI actually assigned"""
+        self._pending[queued_id] = self._pending.pop(requested_id)
+        self._outputs[queued_id] = self._outputs.pop(requested_id)
+
+        # Messages sent before the move were dropped as unregistered; if the
+        # prompt already finished, pick its result up from /history instead
+        outputs = await self._get_history_outputs(queued_id)
+        if outputs:
+            self._outputs[queued_id].update(outputs)
+            future = self._pending[queued_id]
+            if not future.done():
+                future.set_result(None)
+
     def _create_workflow(
-        self, prompt: str, negative_prompt: str, seed: int, width: int, height: int
+        self,
+        prompt: str,
+        negative_prompt: str,
+        seed: int,
+        width: int,
+        height: int,
     ) -> dict:
         """Create ComfyUI workflow JSON (mirrors image-generator.ts)"""
-        return {
-            "3": {
-                "inputs": {
-                    "seed": seed,
-                    "steps": 15,  # Reduced for POC speed
-                    "cfg": 7.5,
-                    "sampler_name": "euler_a",
-                    "scheduler": "normal",
-                    "denoise": 1,
-                    "model": ["4", 0],
-                    "positive": ["6", 0],
-                    "negative": ["7", 0],
-                    "latent_image": ["5", 0],
-                },
-                "class_type": "KSampler",
-            },
-            "4": {
-                "inputs": {"ckpt_name": "v1-5-pruned-emaonly.safetensors"},
-                "class_type": "CheckpointLoaderSimple",
-            },
-            "5": {
-                "inputs": {"width": width, "height": height, "batch_size": 1},
-                "class_type": "EmptyLatentImage",
-            },
-            "6": {
-                "inputs": {"text": prompt, "clip": ["4", 1]},
-                "class_type": "CLIPTextEncode",
-            },
-            "7": {
-                "inputs": {"text": negative_prompt, "clip": ["4", 1]},
-                "class_type": "CLIPTextEncode",
-            },
-            "8": {
-                "inputs": {"samples": ["3", 0], "vae": ["4", 2]},
-                "class_type": "VAEDecode",
-            },
-            "9": {
-                "inputs": {"filename_prefix": "poc_sprite", "images": ["8", 0]},
-                "class_type": "SaveImage",
-            },
+        workflow = copy.deepcopy(_WORKFLOW_TEMPLATE)
+        workflow["3"]["inputs"]["seed"] = seed
+        workflow["5"]["inputs"].update(width=width, height=height)
+        workflow["6"]["inputs"]["text"] = prompt
+        workflow["7"]["inputs"]["text"] = negative_prompt
+        return workflow
+
+    def _create_multi_workflow(
+        self,
+        prompts: List[str],
+        negative_prompt: str,
+        seeds: List[int],
+        width: int,
+        height: int,
+    ) -> Tuple[dict, List[str]]:
+        """
+        Create a workflow with one sampling branch per prompt
+
+        The shared template nodes (checkpoint, LoRA, negative encode) appear
+        once; branch i copies the per-image nodes under ids 100*(i+1) + offset.
+
+        Returns:
+            Tuple of (workflow, SaveImage node ids in prompt order)
+        """
+        workflow = {
+            node_id: copy.deepcopy(node)
+            for node_id, node in _WORKFLOW_TEMPLATE.items()
+            if node_id not in _BRANCH_NODES
         }
+        workflow["7"]["inputs"]["text"] = negative_prompt
+        output_nodes = []
+
+        for i, (prompt, seed) in enumerate(zip(prompts, seeds)):
+            base = 100 * (i + 1)
+            ids = {
+                node_id: str(base + offset)
+                for offset, node_id in enumerate(_BRANCH_NODES)
+            }
+
+            for node_id in _BRANCH_NODES:
+                node = copy.deepcopy(_WORKFLOW_TEMPLATE[node_id])
+                # Rewire links between per-image nodes to this branch's copies
+                for name, value in node["inputs"].items():
+                    if isinstance(value, list) and value[0] in ids:
+                        node["inputs"][name] = [ids[value[0]], value[1]]
+                workflow[ids[node_id]] = node
+
+            workflow[ids["3"]]["inputs"]["seed"] = seed
+            workflow[ids["5"]]["inputs"].update(width=width, height=height)
+            workflow[ids["6"]]["inputs"]["text"] = prompt
+            output_nodes.append(ids["9"])
+
+        return workflow, output_nodes
 
     def _generate_client_id(self) -> str:
         """Generate unique client ID"""
@@ -119,108 +334,171 @@ class ComfyUIClient:
         rand_str = "".join(random.choices(string.ascii_lowercase + string.digits, k=9))
         return f"poc-{timestamp}-{rand_str}"
 
-    async def _queue_prompt(self, workflow: dict, client_id: str) -> str:
+    async def _queue_prompt(self, workflow: dict, prompt_id: str) -> str:
         """Queue a prompt for generation"""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{self.base_url}/prompt",
-                json={"prompt": workflow, "client_id": client_id},
+        response = await self._http.post(
+            "/prompt",
+            json={
+                "prompt": workflow,
+                "prompt_id": prompt_id,
+                "client_id": self.client_id,
+            },
+            timeout=30.0,
+        )
+
+        if response.status_code != 200:
+            raise Exception(
+                f"Failed to queue prompt: {response.status_code} {response.text}"
             )
 
-            if response.status_code != 200:
-                raise Exception(
-                    f"Failed to queue prompt: {response.status_code} {response.text}"
-                )
+        data = orjson.loads(response.content)
+        return data["prompt_id"]
+
+    async def _ensure_websocket(self):
+        """Open the shared websocket and start its reader task if needed"""
+        async with self._ws_lock:
+            if self._ws_task is not None and not self._ws_task.done():
+                return
+
+            # The reader died with the old connection; don't leak its socket
+            if self._ws is not None:
+                try:
+                    await self._ws.close()
+                except Exception:
+                    pass
+                self._ws = None
+
+            ws_url = self.base_url.replace("http", "ws")
+            self._ws = await websockets.connect(
+                f"{ws_url}/ws?clientId={self.client_id}"
+            )
+            self._ws_task = asyncio.create_task(self._ws_reader())
 
-            data = response.json()
-            return data["prompt_id"]
+    async def _ws_reader(self):
+        """Dispatch websocket messages to the futures waiting on each prompt"""
+        try:
+            async for data in self._ws:
+                # Binary frames are preview images, not status messages
+                if isinstance(data, bytes):
+                    continue
+
+                if not any(marker in data for marker in _WS_MESSAGE_MARKERS):
+                    continue
+
+                message = orjson.loads(data)
+                msg_type = message.get("type")
+                msg_data = message.get("data", {})
+                prompt_id = msg_data.get("prompt_id")
+
+                # Only track prompts someone is still waiting on
+                future = self._pending.get(prompt_id)
+                if future is None:
+                    continue
+
+                # Record output filenames as each node finishes
+                if msg_type == "executed":
+                    node_outputs = self._outputs[prompt_id]
+                    node_outputs[msg_data.get("node")] = msg_data.get("output") or {}
+
+                # Check for completion
+                elif msg_type == "executing" and msg_data.get("node") is None:
+                    if not future.done():
+                        future.set_result(None)
+
+                # Check for errors
+                elif msg_type == "execution_error":
+                    if not future.done():
+                        future.set_exception(
+                            Exception(f"Execution error: {msg_data}")
+                        )
 
-    async def _wait_for_completion(self, prompt_id: str, client_id: str):
-        """Wait for image generation to complete via WebSocket"""
-        ws_url = self.base_url.replace("http", "ws")
+            raise Exception("WebSocket closed")
 
-        async with websockets.connect(
-            f"{ws_url}/ws?clientId={client_id}"
-        ) as websocket:
-            timeout_task = asyncio.create_task(asyncio.sleep(self.timeout))
-            message_task = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Fail everything still in flight; the next request reconnects
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(Exception(f"WebSocket error: {e}"))
 
-            try:
-                while True:
-                    if message_task is None:
-                        message_task = asyncio.create_task(websocket.recv())
+    async def _wait_for_completion(self, prompt_id: str) -> Dict[str, dict]:
+        """
+        Wait for image generation to complete via the shared WebSocket
 
-                    done, pending = await asyncio.wait(
-                        [timeout_task, message_task],
-                        return_when=asyncio.FIRST_COMPLETED,
-                    )
+        The prompt must already be registered in _pending/_outputs.
 
-                    if timeout_task in done:
-                        raise Exception("Timeout waiting for image generation")
+        Returns:
+            Node outputs reported by "executed" messages, keyed by node id
+        """
+        try:
+            await asyncio.wait_for(self._pending[prompt_id], self.timeout)
+        except asyncio.TimeoutError:
+            raise Exception("Timeout waiting for image generation")
+
+        return self._outputs[prompt_id]
+
+    async def _get_generated_images(
+        self,
+        prompt_id: str,
+        outputs: Dict[str, dict],
+        output_nodes: Optional[List[str]] = None,
+    ) -> List[bytes]:
+        """
+        Retrieve all generated images for a prompt from ComfyUI
 
-                    if message_task in done:
-                        data = message_task.result()
-                        message_task = None
+        Uses the node outputs captured from the websocket. Nodes ComfyUI
+        served from its cache send no "executed" message, so /history is
+        only queried when an expected output is missing.
 
-                        message = json.loads(data)
+        Images are returned in output_nodes order when given, otherwise in
+        the order ComfyUI reports them.
+        """
+        if not outputs or (
+            output_nodes is not None
+            and any(node_id not in outputs for node_id in output_nodes)
+        ):
+            outputs = await self._get_history_outputs(prompt_id)
+
+        if output_nodes is None:
+            output_nodes = list(outputs)
+
+        # Collect every saved image
+        images = []
+        for node_id in output_nodes:
+            for image in outputs.get(node_id, {}).get("images", []):
+                params = {
+                    "filename": image["filename"],
+                    "subfolder": image.get("subfolder", ""),
+                    "type": image.get("type", "output"),
+                }
+                image_response = await self._http.get(
+                    "/view", params=params, timeout=30.0
+                )
 
-                        # Check for completion
-                        if message.get("type") == "executing":
-                            msg_data = message.get("data", {})
-                            if (
-                                msg_data.get("node") is None
-                                and msg_data.get("prompt_id") == prompt_id
-                            ):
-                                # Generation complete
-                                timeout_task.cancel()
-                                return
+                if image_response.status_code != 200:
+                    raise Exception(
+                        f"Failed to fetch image {image['filename']}: "
+                        f"{image_response.status_code}"
+                    )
 
-                        # Check for errors
-                        if message.get("type") == "execution_error":
-                            raise Exception(
-                                f"Execution error: {message.get('data')}"
-                            )
+                images.append(image_response.content)
 
-            except asyncio.CancelledError:
-                pass
-            finally:
-                timeout_task.cancel()
-                if message_task and not message_task.done():
-                    message_task.cancel()
-
-    async def _get_generated_image(self, prompt_id: str) -> bytes:
-        """Retrieve generated image from ComfyUI"""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Get history to find output filename
-            history_response = await client.get(f"{self.base_url}/history/{prompt_id}")
-
-            if history_response.status_code != 200:
-                raise Exception(
-                    f"Failed to get history: {history_response.status_code}"
-                )
+        if not images:
+            raise Exception("No images found in output")
 
-            history = history_response.json()
-            outputs = history.get(prompt_id, {}).get("outputs", {})
-
-            # Find the saved image
-            for node_id, node_output in outputs.items():
-                if "images" in node_output:
-                    for image in node_output["images"]:
-                        filename = image["filename"]
-                        subfolder = image.get("subfolder", "")
-                        image_type = image.get("type", "output")
-
-                        # Retrieve the image
-                        params = {
-                            "filename": filename,
-                            "subfolder": subfolder,
-                            "type": image_type,
-                        }
-                        image_response = await client.get(
-                            f"{self.base_url}/view", params=params
-                        )
+        return images
 
-                        if image_response.status_code == 200:
-                            return image_response.content
+    async def _get_history_outputs(self, prompt_id: str) -> Dict[str, dict]:
+        """Fetch node outputs for a prompt from /history"""
+        history_response = await self._http.get(
+            f"/history/{prompt_id}", timeout=30.0
+        )
 
-            raise Exception("No images found in output")
+        if history_response.status_code != 200:
+            raise Exception(
+                f"Failed to get history: {history_response.status_code}"
+            )
+
+        history = orjson.loads(history_response.content)
+        return history.get(prompt_id, {}).get("outputs", {})
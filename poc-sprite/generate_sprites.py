@@ -5,16 +5,24 @@ Generates 4-frame walk cycles for test entities using ComfyUI.
 Demonstrates visual consistency and technical feasibility.
 """
 
+import argparse
 import asyncio
-import hashlib
 import time
+import zlib
+from functools import lru_cache
 from pathlib import Path
 from io import BytesIO
+import numpy as np
 from PIL import Image
 
-from comfyui_client import ComfyUIClient
+from comfyui_client import DEFAULT_IMAGE_SIZE, ComfyUIClient
 from sprite_packer import SpriteSheetPacker
 
+try:
+    import uvloop  # Faster event loop; not available on Windows
+except ImportError:
+    uvloop = None
+
 
 # Test entities for POC
 TEST_ENTITIES = [
@@ -32,6 +40,11 @@ TEST_ENTITIES = [
     },
 ]
 
+# Final sprite size, and the size generated by ComfyUI (the client default;
+# 64 is an exact 2x box downscale to 32)
+SPRITE_SIZE = (32, 32)
+GENERATION_SIZE = DEFAULT_IMAGE_SIZE
+
 # Animation poses for 4-frame walk cycle
 WALK_POSES = [
     "standing idle, centered pose",
@@ -41,13 +54,19 @@ WALK_POSES = [
 ]
 
 
+@lru_cache(maxsize=None)
+def _entity_base_seed(entity_name: str) -> int:
+    """Stable 32-bit base seed for an entity (non-cryptographic)"""
+    return zlib.crc32(entity_name.encode())
+
+
 def get_sprite_seed(entity_name: str, animation: str, frame: int) -> int:
     """
     Deterministic seed calculation for reproducibility
 
     Same entity + animation + frame = same sprite every time
     """
-    base_seed = int(hashlib.md5(entity_name.encode()).hexdigest()[:8], 16)
+    base_seed = _entity_base_seed(entity_name)
     animation_offset = {"walk": 1000, "idle": 0, "attack": 2000}
     return base_seed + animation_offset.get(animation, 0) + frame
 
@@ -83,64 +102,121 @@ different art styles, inconsistent style
 
 
 async def generate_walk_cycle(
-    client: ComfyUIClient, entity: dict, output_dir: Path
+    client: ComfyUIClient, entity: dict, output_dir: Path, validate: bool = False
 ) -> dict:
     """
     Generate 4-frame walk cycle for an entity
 
-    Returns validation results
+    Progress is buffered and printed as one block when the entity finishes,
+    so concurrently generated entities don't interleave their output.
+
+    Consistency validation only runs when validate is True.
+
+    Returns generation stats (and validation results if requested)
     """
     entity_name = entity["name"]
     entity_desc = entity["description"]
 
-    print(f"\n[POC] Generating {entity_name.capitalize()}...")
-
-    frames = []
-    timings = []
+    report = [f"\n[POC] Generating {entity_name.capitalize()}..."]
 
+    # Frames that share a pose produce byte-identical prompts, so each unique
+    # pose is generated once and reused for every frame that needs it
+    pose_frames: dict[str, list[int]] = {}
     for frame_idx, pose in enumerate(WALK_POSES):
-        start_time = time.time()
+        pose_frames.setdefault(pose, []).append(frame_idx)
+
+    poses = list(pose_frames)
+    prompts = [build_prompt(entity_desc, pose) for pose in poses]
+
+    # Deterministic seed from the first frame using each pose
+    seeds = [
+        get_sprite_seed(entity_name, "walk", pose_frames[pose][0]) for pose in poses
+    ]
+
+    # Generate every pose in one workflow sharing the checkpoint and
+    # negative prompt encode
+    start_time = time.time()
+    images = await client.generate_images(
+        prompts=prompts,
+        negative_prompt=NEGATIVE_PROMPT,
+        seeds=seeds,
+        width=GENERATION_SIZE,  # Generate larger, will downscale
+        height=GENERATION_SIZE,
+    )
+    batch_time = time.time() - start_time
 
-        # Calculate deterministic seed
-        seed = get_sprite_seed(entity_name, "walk", frame_idx)
+    # Entities are generated concurrently, so this includes time spent queued
+    # in ComfyUI behind other entities' workflows
+    status = "✗ FAILED" if images is None else f"✓ ({batch_time:.1f}s incl. queue)"
+    for frame_idx, pose in enumerate(WALK_POSES):
+        report.append(f"  Frame {frame_idx}/4: {pose[:30]}... {status}")
 
-        # Build prompt
-        prompt = build_prompt(entity_desc, pose)
+    if images is None:
+        print("\n".join(report))
+        return {"entity": entity_name, "error": "Walk cycle generation failed"}
 
-        print(f"  Frame {frame_idx}/4: {pose[:30]}...", end=" ", flush=True)
+    # Decoding, resizing, PNG encoding and packing are blocking PIL work;
+    # run them off the event loop so other entities keep making progress
+    pose_images = dict(zip(poses, images))
+    frames = await asyncio.to_thread(
+        save_walk_cycle, entity_name, pose_images, output_dir
+    )
+    report.append("  Packing sprite sheet... ✓")
 
-        # Generate image
-        image_data = await client.generate_image(
-            prompt=prompt,
-            negative_prompt=NEGATIVE_PROMPT,
-            seed=seed,
-            width=128,  # Generate larger, will downscale
-            height=128,
+    # Validate consistency
+    validation = None
+    if validate:
+        validation = validate_sprites(frames)
+        report.append(
+            f"  Validating consistency... ✓ "
+            f"(similarity: {validation['visual_similarity']:.0%})"
         )
+    print("\n".join(report))
+
+    return {
+        "entity": entity_name,
+        "frames": len(frames),
+        "total_time": batch_time,  # includes ComfyUI queue time
+        "validation": validation,
+    }
 
-        if image_data is None:
-            print("✗ FAILED")
-            return {"error": f"Frame {frame_idx} generation failed"}
 
-        # Convert to PIL Image
-        img = Image.open(BytesIO(image_data))
+def save_walk_cycle(
+    entity_name: str, pose_images: dict[str, bytes], output_dir: Path
+) -> list[np.ndarray]:
+    """
+    Normalize generated images and write frames, sprite sheet and metadata
 
-        # Normalize to 32x32
-        img_normalized = SpriteSheetPacker.normalize_sprite(img, (32, 32))
+    Blocking; call via asyncio.to_thread from async code.
 
-        # Save individual frame
-        entity_dir = output_dir / entity_name
-        entity_dir.mkdir(parents=True, exist_ok=True)
-        img_normalized.save(entity_dir / f"walk_{frame_idx}.png")
+    Returns the walk cycle frames as (H, W, 4) uint8 RGBA arrays
+    """
+    entity_dir = output_dir / entity_name
+    entity_dir.mkdir(parents=True, exist_ok=True)
+
+    # Decode and normalize to SPRITE_SIZE once per unique pose
+    normalized = {}
+    for pose, image_data in pose_images.items():
+        img_normalized = SpriteSheetPacker.normalize_sprite(
+            Image.open(BytesIO(image_data)), SPRITE_SIZE
+        )
+        normalized[pose] = (img_normalized, np.asarray(img_normalized))
+
+    frames = []
 
-        frames.append(img_normalized)
+    for frame_idx, pose in enumerate(WALK_POSES):
+        img_normalized, frame = normalized[pose]
+
+        # Save individual frame
+        img_normalized.save(
+            entity_dir / f"walk_{frame_idx}.png",
+            "PNG",
+            compress_level=SpriteSheetPacker.PNG_COMPRESS_LEVEL,
+        )
 
-        elapsed = time.time() - start_time
-        timings.append(elapsed)
-        print(f"✓ ({elapsed:.1f}s)")
+        frames.append(frame)
 
     # Pack sprite sheet
-    print("  Packing sprite sheet...", end=" ", flush=True)
     packer = SpriteSheetPacker()
     sprite_sheet, metadata = packer.pack(frames, entity_name, "walk")
 
@@ -148,74 +224,84 @@ async def generate_walk_cycle(
     SpriteSheetPacker.save_sprite_sheet(
         sprite_sheet, metadata, str(output_dir), entity_name
     )
-    print("✓")
 
-    # Validate consistency
-    print("  Validating consistency...", end=" ", flush=True)
-    validation = validate_sprites(frames)
-    print(f"✓ (similarity: {validation['visual_similarity']:.0%})")
+    return frames
+
+
+# Minimum mean dHash similarity between adjacent frames (<= 10 of 64 bits)
+MIN_VISUAL_SIMILARITY = 1.0 - 10 / 64
 
-    return {
-        "entity": entity_name,
-        "frames": len(frames),
-        "avg_time": sum(timings) / len(timings),
-        "total_time": sum(timings),
-        "validation": validation,
-    }
+
+def dhash(frame: np.ndarray, hash_size: int = 8) -> np.ndarray:
+    """
+    Compute a 64-bit difference hash (dHash) of an RGBA frame array
+
+    Returns the hash packed into hash_size bytes
+    """
+    gray = np.asarray(
+        Image.fromarray(frame, "RGBA")
+        .convert("L")
+        .resize((hash_size + 1, hash_size), Image.Resampling.BOX),
+        dtype=np.int16,
+    )
+    return np.packbits(gray[:, 1:] > gray[:, :-1])
 
 
-def validate_sprites(frames: list[Image.Image]) -> dict:
+def validate_sprites(frames: list[np.ndarray]) -> dict:
     """
     Validate sprite consistency
 
     Checks:
     - Size consistency
     - Transparency
-    - Visual similarity (simplified)
+    - Visual similarity (dHash of adjacent frames)
     """
     if not frames:
         return {"passes": False, "error": "No frames"}
 
     results = {
-        "size_consistent": all(f.size == frames[0].size for f in frames),
-        "has_transparency": all(f.mode == "RGBA" for f in frames),
+        "size_consistent": all(f.shape == frames[0].shape for f in frames),
+        "has_transparency": all(f.ndim == 3 and f.shape[2] == 4 for f in frames),
         "frame_count": len(frames),
     }
 
-    # Simple visual similarity check: compare color histograms
+    # Visual similarity check: compare perceptual hashes of adjacent frames
     if len(frames) > 1:
-        histograms = [f.histogram() for f in frames]
-        similarity_sum = 0
+        hashes = np.stack([dhash(f) for f in frames])
 
-        for i in range(len(histograms) - 1):
-            # Compare adjacent frames
-            h1, h2 = histograms[i], histograms[i + 1]
-            similarity = sum(min(a, b) for a, b in zip(h1, h2)) / sum(h1)
-            similarity_sum += similarity
+        # Hamming distance between each adjacent pair of 64-bit hashes
+        distances = np.unpackbits(hashes[:-1] ^ hashes[1:], axis=1).sum(axis=1)
 
-        results["visual_similarity"] = similarity_sum / (len(frames) - 1)
+        results["visual_similarity"] = float(1.0 - distances.mean() / 64)
     else:
         results["visual_similarity"] = 1.0
 
     results["passes"] = (
         results["size_consistent"]
         and results["has_transparency"]
-        and results["visual_similarity"] > 0.5  # At least 50% similar
+        # Unrelated images differ in ~32 of 64 dHash bits by chance; require
+        # at most 10 differing bits (~84% similar)
+        and results["visual_similarity"] >= MIN_VISUAL_SIMILARITY
     )
 
     return results
 
 
-async def main():
+async def main(validate: bool = False):
     """Main POC execution"""
     print("=" * 50)
     print("POC: Isometric Sprite Animation Generator")
     print("=" * 50)
 
-    # Initialize ComfyUI client
     comfyui_url = "http://localhost:8188"
-    client = ComfyUIClient(comfyui_url)
 
+    # Initialize ComfyUI client (closes its connection pool on exit)
+    async with ComfyUIClient(comfyui_url) as client:
+        await run_poc(client, comfyui_url, validate)
+
+
+async def run_poc(client: ComfyUIClient, comfyui_url: str, validate: bool):
+    """Generate, pack and (optionally) validate sprites for all test entities"""
     print(f"\n[POC] Connecting to ComfyUI at {comfyui_url}...")
     if not await client.is_available():
         print("✗ ComfyUI not available!")
@@ -229,13 +315,24 @@ async def main():
     output_dir = Path("output")
     output_dir.mkdir(exist_ok=True)
 
-    # Generate sprites for all test entities
+    # Generate sprites for all test entities concurrently so ComfyUI's
+    # queue never runs dry
     results = []
     total_start = time.time()
 
-    for entity in TEST_ENTITIES:
-        result = await generate_walk_cycle(client, entity, output_dir)
-        results.append(result)
+    outcomes = await asyncio.gather(
+        *(
+            generate_walk_cycle(client, entity, output_dir, validate)
+            for entity in TEST_ENTITIES
+        ),
+        return_exceptions=True,
+    )
+
+    for entity, outcome in zip(TEST_ENTITIES, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"\n✗ {entity['name']}: {outcome}")
+            outcome = {"entity": entity["name"], "error": str(outcome)}
+        results.append(outcome)
 
     total_time = time.time() - total_start
 
@@ -253,12 +350,15 @@ async def main():
 
     if successful:
         total_frames = sum(r["frames"] for r in successful)
-        avg_time_per_frame = sum(r["avg_time"] for r in successful) / len(successful)
+        # Per-entity times overlap (and include queueing), so derive the
+        # per-frame cost from wall time
+        avg_time_per_frame = total_time / total_frames
 
         print(f"\nTotal frames: {total_frames}")
         print(f"Total time: {total_time:.1f}s")
         print(f"Average: {avg_time_per_frame:.1f}s per frame")
 
+    if successful and validate:
         print("\nValidation Results:")
         for result in successful:
             v = result["validation"]
@@ -276,4 +376,15 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="check size, transparency and visual similarity of each walk cycle",
+    )
+    args = parser.parse_args()
+
+    if uvloop is not None:
+        uvloop.run(main(args.validate))
+    else:
+        asyncio.run(main(args.validate))
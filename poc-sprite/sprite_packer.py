@@ -5,20 +5,25 @@ Packs animation frames into a grid layout with metadata.
 
 import json
 from typing import List, Tuple
+import numpy as np
 from PIL import Image
 
 
 class SpriteSheetPacker:
     """Pack multiple sprite frames into a single sprite sheet"""
 
+    # Tiny pixel-art sprites compress about as well at level 1 as at the
+    # default level 6, for a fraction of the zlib time
+    PNG_COMPRESS_LEVEL = 1
+
     def pack(
-        self, frames: List[Image.Image], entity_name: str, animation_name: str = "walk"
+        self, frames: List[np.ndarray], entity_name: str, animation_name: str = "walk"
     ) -> Tuple[Image.Image, dict]:
         """
         Pack frames into a grid sprite sheet
 
         Args:
-            frames: List of PIL Images to pack
+            frames: List of (H, W, 4) uint8 RGBA frame arrays to pack
             entity_name: Name of the entity (e.g., "goblin")
             animation_name: Name of the animation (e.g., "walk")
 
@@ -29,35 +34,47 @@ class SpriteSheetPacker:
             raise ValueError("Cannot pack empty frame list")
 
         # Get sprite size from first frame
-        sprite_width, sprite_height = frames[0].size
+        sprite_height, sprite_width = frames[0].shape[:2]
 
         # Calculate grid dimensions (2x2 for 4 frames, etc.)
         num_frames = len(frames)
         cols = 2 if num_frames > 1 else 1
         rows = (num_frames + cols - 1) // cols  # Ceiling division
 
-        # Create sprite sheet canvas
-        sheet_width = sprite_width * cols
-        sheet_height = sprite_height * rows
-        sprite_sheet = Image.new("RGBA", (sheet_width, sheet_height), (0, 0, 0, 0))
-
-        # Pack frames and build metadata
+        # Ensure every frame is the correct size
+        cells = []
+        for frame in frames:
+            if frame.shape[:2] != (sprite_height, sprite_width):
+                frame = np.asarray(
+                    Image.fromarray(frame, "RGBA").resize(
+                        (sprite_width, sprite_height), Image.Resampling.NEAREST
+                    )
+                )
+            cells.append(frame)
+
+        # Fill a ragged last row with fully transparent cells
+        blank = np.zeros((sprite_height, sprite_width, 4), dtype=np.uint8)
+        cells.extend([blank] * (rows * cols - num_frames))
+
+        # Lay the grid out in one pass: (rows, cols, H, W, 4) -> (rows*H, cols*W, 4)
+        sheet = (
+            np.stack(cells)
+            .reshape(rows, cols, sprite_height, sprite_width, 4)
+            .transpose(0, 2, 1, 3, 4)
+            .reshape(rows * sprite_height, cols * sprite_width, 4)
+        )
+        sprite_sheet = Image.fromarray(sheet, "RGBA")
+
+        # Build frame metadata
         frame_metadata = []
 
-        for i, frame in enumerate(frames):
-            # Ensure frame is correct size
-            if frame.size != (sprite_width, sprite_height):
-                frame = frame.resize((sprite_width, sprite_height), Image.Resampling.LANCZOS)
-
+        for i in range(num_frames):
             # Calculate position in grid
             col = i % cols
             row = i // cols
             x = col * sprite_width
             y = row * sprite_height
 
-            # Paste frame into sheet
-            sprite_sheet.paste(frame, (x, y))
-
             # Add metadata for this frame
             frame_metadata.append({
                 "x": x,
@@ -101,8 +118,10 @@ class SpriteSheetPacker:
             new_width = int(img_width * scale)
             new_height = int(img_height * scale)
 
-            # Resize with high-quality resampling
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            # Pixel art must not be anti-aliased: average whole blocks when
+            # shrinking and repeat pixels when enlarging
+            resample = Image.Resampling.BOX if scale < 1 else Image.Resampling.NEAREST
+            image = image.resize((new_width, new_height), resample)
 
         # Create centered canvas
         canvas = Image.new("RGBA", target_size, (0, 0, 0, 0))
@@ -136,7 +155,9 @@ class SpriteSheetPacker:
 
         # Save sprite sheet
         sheet_path = output_dir / "spritesheet.png"
-        sprite_sheet.save(sheet_path, "PNG")
+        sprite_sheet.save(
+            sheet_path, "PNG", compress_level=SpriteSheetPacker.PNG_COMPRESS_LEVEL
+        )
 
         # Save metadata
         metadata_path = output_dir / "metadata.json"
@@ -46,6 +46,22 @@ else
     echo "✓ Model downloaded successfully"
 fi
 
+# Check if LCM LoRA (used by poc-sprite for few-step sampling) already exists
+if docker exec dndan-comfyui test -f /opt/ComfyUI/models/loras/lcm-lora-sdv1-5.safetensors 2>/dev/null; then
+    echo "✓ LCM LoRA already downloaded"
+else
+    echo "Downloading LCM LoRA for SD 1.5 (~130MB)..."
+    echo ""
+
+    docker exec dndan-comfyui mkdir -p /opt/ComfyUI/models/loras
+    docker exec dndan-comfyui wget -q --show-progress \
+        -O /opt/ComfyUI/models/loras/lcm-lora-sdv1-5.safetensors \
+        https://huggingface.co/latent-consistency/lcm-lora-sdv1-5/resolve/main/pytorch_lora_weights.safetensors
+
+    echo ""
+    echo "✓ LCM LoRA downloaded successfully"
+fi
+
 # Verify model
 echo ""
 echo "Checking available models..."